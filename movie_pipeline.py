@@ -1,144 +1,522 @@
-import requests
+import asyncio
+import json
+import os
+import aiohttp
+import numexpr as ne
 import pandas as pd
 import sqlite3
-from datetime import datetime
 import time
-from sklearn.preprocessing import MinMaxScaler
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import numpy as np
 
 
+def retry_after_seconds(value):
+    """Parse a Retry-After header (delay in seconds or HTTP date) into seconds"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Token bucket shared by every request so bursts stay under the API rate"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a request token is available and take it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
 class MovieRecommendationPipeline:
     def __init__(self, tmdb_api_key):
         self.api_key = tmdb_api_key
         self.base_url = "https://api.themoviedb.org/3"
         self.db_name = "movie_recommendations.db"
-
-    def extract_movie_data(self, num_pages=5):
-        """Extract movie data from TMDB API"""
+        self.session = None
+        self.semaphore = None
+        self.rate_limiter = None
+        self.genre_names = {}
+        self.max_concurrent_requests = 8
+        self.max_retries = 3
+        self.backoff_factor = 0.5
+        self.requests_per_second = 40
+        self.numerical_cols = ['popularity', 'vote_average',
+                               'vote_count', 'runtime', 'roi']
+        self.top_k = 20
+        self.list_cols = ['genres', 'cast', 'keywords']
+
+    @property
+    def parquet_path(self):
+        """Parquet export path, kept next to the database like the viewer expects"""
+        return f"{os.path.splitext(self.db_name)[0]}.parquet"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def get_session(self):
+        """Return the shared HTTP session, creating it and the request limits on first use"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=16)
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=5))
+            # Request limits share the session's lifetime and event loop
+            self.semaphore = asyncio.Semaphore(self.max_concurrent_requests)
+            # Respect API rate limits across all concurrent requests
+            self.rate_limiter = RateLimiter(self.requests_per_second)
+        return self.session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def get_json(self, url, params):
+        """GET a TMDB endpoint, retrying transient failures with backoff"""
+        session = self.get_session()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            # Bound the number of requests in flight; the slot is released
+            # before any backoff so one flaky movie doesn't hold it
+            async with self.semaphore:
+                await self.rate_limiter.acquire()
+                try:
+                    async with session.get(url, params=params) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        # Only rate limiting and server errors are worth retrying
+                        if response.status == 429:
+                            retry_after = retry_after_seconds(
+                                response.headers.get('Retry-After'))
+                        elif response.status < 500:
+                            return None
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    pass
+
+            if attempt < self.max_retries:
+                if retry_after is None:
+                    retry_after = self.backoff_factor * 2 ** attempt
+                await asyncio.sleep(retry_after)
+
+        return None
+
+    async def fetch_genre_names(self):
+        """Fetch TMDB's genre id to name mapping"""
+        url = f"{self.base_url}/genre/movie/list"
+        response = await self.get_json(url, {'api_key': self.api_key})
+        # Without the mapping every list-only row would silently lose its genres
+        if response is None:
+            raise RuntimeError(f"Failed to fetch genre list from {url}")
+        return {genre['id']: genre['name'] for genre in response['genres']}
+
+    async def fetch_page(self, page, fetch_details=True):
+        """Fetch one page of popular movies and, optionally, their details"""
+        url = f"{self.base_url}/movie/popular"
+        params = {
+            'api_key': self.api_key,
+            'page': page
+        }
+
+        response = await self.get_json(url, params)
+        if response is None:
+            return []
+        movies = response['results']
+
+        # The list response covers everything except runtime, budget,
+        # revenue, credits and keywords, so skip the detail calls if the
+        # caller doesn't need those
+        if not fetch_details:
+            return [self.build_movie_row(movie) for movie in movies]
+
+        # Fan out detail requests for the whole page at once
+        movies_list = await asyncio.gather(
+            *[self.fetch_details(movie) for movie in movies])
+        return [movie_data for movie_data in movies_list if movie_data is not None]
+
+    async def fetch_details(self, movie):
+        """Fetch additional details for a single movie"""
+        movie_id = movie['id']
+        details_url = f"{self.base_url}/movie/{movie_id}"
+        details_params = {
+            'api_key': self.api_key,
+            'append_to_response': 'credits,keywords'
+        }
+
+        movie_details = await self.get_json(details_url, details_params)
+        if movie_details is None:
+            return None
+
+        return self.build_movie_row(movie, movie_details)
+
+    def build_movie_row(self, movie, movie_details=None):
+        """Flatten a popular-list entry and its optional details into a row"""
+        if movie_details is None:
+            # Without details, genres come from the list's genre_ids and the
+            # detail-only fields are left empty
+            movie_details = {'genres': [
+                {'name': self.genre_names[genre_id]}
+                for genre_id in movie.get('genre_ids', [])
+                if genre_id in self.genre_names
+            ]}
+
+        return {
+            'movie_id': movie['id'],
+            'title': movie['title'],
+            'release_date': movie.get('release_date'),
+            'popularity': movie.get('popularity'),
+            'vote_average': movie.get('vote_average'),
+            'vote_count': movie.get('vote_count'),
+            'genres': [genre['name'] for genre in movie_details.get('genres', [])],
+            'runtime': movie_details.get('runtime'),
+            'budget': movie_details.get('budget'),
+            'revenue': movie_details.get('revenue'),
+            'director': next((crew['name'] for crew in movie_details.get('credits', {}).get('crew', [])
+                              if crew['job'] == 'Director'), None),
+            'cast': [cast['name'] for cast in movie_details.get('credits', {}).get('cast', [])[:5]],
+            'keywords': [kw['name'] for kw in movie_details.get('keywords', {}).get('keywords', [])]
+        }
+
+    async def extract_movie_data(self, num_pages=5, fetch_details=True):
+        """Extract movie data from TMDB API into the movies_raw staging table"""
         print("Starting data extraction...")
-        movies_list = []
-
-        for page in range(1, num_pages + 1):
-            # Get popular movies
-            url = f"{self.base_url}/movie/popular"
-            params = {
-                'api_key': self.api_key,
-                'page': page
-            }
-
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                movies = response.json()['results']
-
-                for movie in movies:
-                    # Get additional movie details
-                    movie_id = movie['id']
-                    details_url = f"{self.base_url}/movie/{movie_id}"
-                    details_params = {
-                        'api_key': self.api_key,
-                        'append_to_response': 'credits,keywords'
-                    }
-
-                    details_response = requests.get(
-                        details_url, params=details_params)
-                    if details_response.status_code == 200:
-                        movie_details = details_response.json()
-
-                        movie_data = {
-                            'movie_id': movie_id,
-                            'title': movie['title'],
-                            'release_date': movie.get('release_date'),
-                            'popularity': movie.get('popularity'),
-                            'vote_average': movie.get('vote_average'),
-                            'vote_count': movie.get('vote_count'),
-                            'genres': ','.join([genre['name'] for genre in movie_details.get('genres', [])]),
-                            'runtime': movie_details.get('runtime'),
-                            'budget': movie_details.get('budget'),
-                            'revenue': movie_details.get('revenue'),
-                            'director': next((crew['name'] for crew in movie_details.get('credits', {}).get('crew', [])
-                                              if crew['job'] == 'Director'), None),
-                            'cast': ','.join([cast['name'] for cast in movie_details.get('credits', {}).get('cast', [])[:5]]),
-                            'keywords': ','.join([kw['name'] for kw in movie_details.get('keywords', {}).get('keywords', [])])
-                        }
-                        movies_list.append(movie_data)
-
-                    # Respect API rate limits
-                    time.sleep(0.25)
-
-            print(f"Processed page {page}/{num_pages}")
-
-        return pd.DataFrame(movies_list)
+        if not fetch_details:
+            self.genre_names = await self.fetch_genre_names()
+
+        conn = sqlite3.connect(self.db_name)
+        conn.execute("DROP TABLE IF EXISTS movies_raw")
+        conn.execute("""
+        CREATE TABLE movies_raw (
+            movie_id INTEGER,
+            title TEXT,
+            release_date TEXT,
+            popularity REAL,
+            vote_average REAL,
+            vote_count INTEGER,
+            genres TEXT,
+            runtime REAL,
+            budget INTEGER,
+            revenue INTEGER,
+            director TEXT,
+            "cast" TEXT,
+            keywords TEXT
+        )
+        """)
+
+        # Write each page as soon as it arrives so only one page of rows is
+        # held in memory at a time
+        movie_count = 0
+        pages = [asyncio.create_task(self.fetch_page(page, fetch_details))
+                 for page in range(1, num_pages + 1)]
+        try:
+            for done, page_movies in enumerate(asyncio.as_completed(pages), start=1):
+                rows = [
+                    {**movie, **{col: json.dumps(movie[col])
+                                 for col in self.list_cols}}
+                    for movie in await page_movies
+                ]
+                conn.executemany("""
+                INSERT INTO movies_raw VALUES (
+                    :movie_id, :title, :release_date, :popularity,
+                    :vote_average, :vote_count, :genres, :runtime, :budget,
+                    :revenue, :director, :cast, :keywords)
+                """, rows)
+                conn.commit()
+                movie_count += len(rows)
+                print(f"Processed page {done}/{num_pages}")
+        finally:
+            # Don't leave page fetches running if a write or fetch failed
+            for task in pages:
+                task.cancel()
+            await asyncio.gather(*pages, return_exceptions=True)
+            conn.close()
+
+        return movie_count
+
+    def read_raw_movies(self, chunksize=1000):
+        """Read the movies_raw staging table back in chunks"""
+        chunks = []
+        with sqlite3.connect(self.db_name) as conn:
+            for chunk in pd.read_sql_query(
+                    "SELECT * FROM movies_raw", conn, chunksize=chunksize):
+                # Restore the list columns that were stored as JSON arrays
+                for col in self.list_cols:
+                    chunk[col] = [json.loads(value) for value in chunk[col]]
+                chunks.append(chunk)
+
+        # Scaling and genre encoding need statistics over every row, so the
+        # chunks are combined before transform_data
+        return pd.concat(chunks, ignore_index=True)
 
     def transform_data(self, df):
         """Transform and preprocess the movie data"""
         print("Starting data transformation...")
 
-        # Clean dates
-        df['release_date'] = pd.to_datetime(
-            df['release_date'], errors='coerce')
-        df['release_year'] = df['release_date'].dt.year
+        # Popular pages can shift while being paged, listing a movie twice
+        df = df.drop_duplicates('movie_id', ignore_index=True)
+
+        # Release dates are ISO "YYYY-MM-DD" strings, so slice the year
+        # out directly instead of parsing a full datetime column
+        df['release_year'] = pd.to_numeric(
+            df['release_date'].str.slice(0, 4), errors='coerce').astype('Int16')
 
         # Handle missing values
-        df['runtime'] = df['runtime'].fillna(df['runtime'].mean())
+        # Runtime is 0 when no details were fetched at all
+        df['runtime'] = df['runtime'].fillna(df['runtime'].mean()).fillna(0)
         df['budget'] = df['budget'].fillna(0)
         df['revenue'] = df['revenue'].fillna(0)
 
-        # Create derived features
-        df['roi'] = np.where(
-            df['budget'] != 0, (df['revenue'] - df['budget']) / df['budget'], 0)
-
-        # Normalize numerical features
-        scaler = MinMaxScaler()
-        numerical_cols = ['popularity', 'vote_average',
-                          'vote_count', 'runtime', 'roi']
-        df[numerical_cols] = scaler.fit_transform(df[numerical_cols])
+        # Budget and revenue are whole amounts with no upper bound (either can
+        # exceed 2**31), so they stay int64; the remaining numeric columns are
+        # downcast to float32 by the scaling step below
+        df = df.astype({'budget': 'int64', 'revenue': 'int64'})
+
+        # Create derived features (ROI is 0 where there is no budget)
+        budget = df['budget'].to_numpy(dtype=np.float64)
+        revenue = df['revenue'].to_numpy(dtype=np.float64)
+        # numexpr fuses the subtract and divide into one multi-threaded pass
+        df['roi'] = ne.evaluate(
+            "where(budget != 0, (revenue - budget) / budget, 0)")
+
+        # Normalize numerical features to [0, 1] in place
+        numerical_cols = self.numerical_cols
+        arr = df[numerical_cols].to_numpy(dtype=np.float32, copy=True)
+        mn = np.nanmin(arr, axis=0)
+        rng = np.nanmax(arr, axis=0) - mn
+        rng[rng == 0] = 1  # constant columns scale to 0, as MinMaxScaler does
+        ne.evaluate("(arr - mn) / rng", out=arr)
+        df[numerical_cols] = arr
 
         # Create genre features (one-hot encoding)
-        genres_df = df['genres'].str.get_dummies(sep=',')
-
-        # Combine features for recommendation
-        feature_cols = numerical_cols + list(genres_df.columns)
-        features_df = pd.concat([df[numerical_cols], genres_df], axis=1)
-
-        return df, features_df
-
-    def load_data(self, movies_df, features_df):
+        genres_df = self.encode_genres(df['genres'])
+
+        # Feature table keeps only the key and genre dummies; the numerical
+        # features already live in movies and are joined on movie_id
+        features_df = genres_df
+        features_df.insert(0, 'movie_id', df['movie_id'])
+
+        # Per-genre statistics: explode each movie's genre list once so
+        # movies count towards every genre they belong to
+        genre_rollup_df = (
+            df[['movie_id', 'genres', 'vote_average', 'popularity']]
+            .explode('genres')
+            .groupby('genres')
+            .agg(movie_count=('movie_id', 'size'),
+                 avg_rating=('vote_average', 'mean'),
+                 avg_popularity=('popularity', 'mean'))
+            .rename_axis('genre')
+            .reset_index()
+        )
+
+        return df, features_df, genre_rollup_df
+
+    def encode_genres(self, genres):
+        """One-hot encode per-movie genre lists into a uint8 matrix"""
+        genre_lists = [genre_list or [] for genre_list in genres]
+        vocab = sorted({genre for genre_list in genre_lists for genre in genre_list})
+        genre_index = {genre: i for i, genre in enumerate(vocab)}
+
+        # Scatter ones at (row, genre) positions in a single fancy-index write
+        lengths = [len(genre_list) for genre_list in genre_lists]
+        rows = np.repeat(np.arange(len(genre_lists)), lengths)
+        cols = np.fromiter(
+            (genre_index[genre] for genre_list in genre_lists for genre in genre_list),
+            dtype=np.intp, count=len(rows))
+        one_hot = np.zeros((len(genre_lists), len(vocab)), dtype=np.uint8)
+        one_hot[rows, cols] = 1
+
+        return pd.DataFrame(one_hot, columns=vocab, index=genres.index)
+
+    def compute_recommendations(self, movies_df, features_df, block_size=1024):
+        """Find the top-k most similar movies for each movie by cosine similarity"""
+        # Score each movie once so no neighbour can fill two ranks
+        unique = ~movies_df['movie_id'].duplicated().to_numpy()
+        features = movies_df[self.numerical_cols].join(
+            features_df.drop(columns='movie_id'))[unique]
+        movie_ids = movies_df['movie_id'].to_numpy()[unique]
+        F = np.nan_to_num(features.to_numpy(dtype=np.float32))
+        F /= np.linalg.norm(F, axis=1, keepdims=True) + 1e-9
+
+        k = min(self.top_k, len(F) - 1)
+        rows = []
+        if k <= 0:
+            return rows
+
+        # Score a block of rows at a time so memory stays O(block_size * N)
+        for start in range(0, len(F), block_size):
+            block_ids = movie_ids[start:start + block_size]
+            S = F[start:start + block_size] @ F.T
+            # A movie is not its own neighbour
+            block_rows = np.arange(len(block_ids))
+            S[block_rows, start + block_rows] = -np.inf
+
+            top = np.argpartition(-S, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(S, top, axis=1)
+            order = np.argsort(-scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            scores = np.take_along_axis(scores, order, axis=1)
+
+            for movie_id, neighbors, neighbor_scores in zip(
+                    block_ids.tolist(), movie_ids[top].tolist(), scores.tolist()):
+                rows.extend(
+                    (movie_id, rank, neighbor_id, score)
+                    for rank, (neighbor_id, score) in enumerate(
+                        zip(neighbors, neighbor_scores), start=1))
+
+        return rows
+
+    def load_data(self, movies_df, features_df, genre_rollup_df):
         """Load processed data into SQLite database"""
         print("Starting data loading...")
 
+        recommendations = self.compute_recommendations(movies_df, features_df)
+
+        # SQLite has no list type, so list columns are stored comma-joined
+        movies_df = movies_df.assign(**{
+            col: movies_df[col].str.join(',') for col in self.list_cols
+        })
+
         conn = sqlite3.connect(self.db_name)
 
+        # Bulk-load settings: WAL with relaxed syncing avoids an fsync per
+        # statement, and a larger page cache keeps index builds in memory
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA cache_size=-65536")
+
         # Create movies table
-        movies_df.to_sql('movies', conn, if_exists='replace', index=False)
+        movies_df.to_sql('movies', conn, if_exists='replace', index=False,
+                         method='multi', chunksize=500)
 
         # Create features table
-        features_df.to_sql('movie_features', conn,
-                           if_exists='replace', index=False)
+        features_df.to_sql('movie_features', conn, if_exists='replace',
+                           index=False, method='multi', chunksize=500)
+
+        # Create genre rollup table
+        genre_rollup_df.to_sql('genre_rollup', conn, if_exists='replace',
+                               index=False)
+
+        # Build indexes, stats and views in a single transaction
+        conn.execute("BEGIN")
+
+        # The raw staging rows have been transformed; don't keep a second copy
+        conn.execute("DROP TABLE IF EXISTS movies_raw")
+
+        # Index the columns the views and viewer queries filter and sort on
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_vote_count ON movies(vote_count)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_vote_average ON movies(vote_average DESC)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_release_year ON movies(release_year)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_genres ON movies(genres)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_movie_id ON movies(movie_id)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movies_title ON movies(title)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_movie_features_movie_id ON movie_features(movie_id)")
+
+        # Store precomputed nearest neighbours for "similar to X" lookups
+        conn.execute("DROP TABLE IF EXISTS recommendations")
+        conn.execute("""
+        CREATE TABLE recommendations (
+            movie_id INTEGER,
+            rank INTEGER,
+            neighbor_id INTEGER,
+            score REAL
+        )
+        """)
+        conn.executemany(
+            "INSERT INTO recommendations VALUES (?, ?, ?, ?)", recommendations)
+        conn.execute(
+            "CREATE INDEX idx_recommendations_movie_id ON recommendations(movie_id, rank)")
+
+        # Full-text index over title and genres for keyword search
+        conn.execute("DROP TABLE IF EXISTS movies_fts")
+        conn.execute("""
+        CREATE VIRTUAL TABLE movies_fts USING fts5(
+            title, genres, content='movies', content_rowid='rowid')
+        """)
+        conn.execute("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')")
+
+        # Precompute aggregates so views and queries don't rescan movies
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_stats (
+            key TEXT PRIMARY KEY,
+            value REAL
+        )
+        """)
+        conn.execute("""
+        INSERT OR REPLACE INTO pipeline_stats (key, value)
+        SELECT 'avg_vote_count', AVG(vote_count) FROM movies
+        """)
 
         # Create some useful views
+        conn.execute("DROP VIEW IF EXISTS top_rated_movies")
         conn.execute("""
-        CREATE VIEW IF NOT EXISTS top_rated_movies AS
+        CREATE VIEW top_rated_movies AS
         SELECT movie_id, title, vote_average, vote_count, popularity
         FROM movies
-        WHERE vote_count > (SELECT AVG(vote_count) FROM movies)
+        WHERE vote_count > (
+            SELECT value FROM pipeline_stats WHERE key = 'avg_vote_count')
         ORDER BY vote_average DESC
         LIMIT 100
         """)
 
+        conn.execute("DROP VIEW IF EXISTS genre_stats")
         conn.execute("""
-        CREATE VIEW IF NOT EXISTS genre_stats AS
-        SELECT 
-            genres,
-            COUNT(*) as movie_count,
-            AVG(vote_average) as avg_rating,
-            AVG(popularity) as avg_popularity
-        FROM movies
-        GROUP BY genres
+        CREATE VIEW genre_stats AS
+        SELECT genre, movie_count, avg_rating, avg_popularity
+        FROM genre_rollup
+        """)
+
+        conn.execute("""
+        CREATE VIEW IF NOT EXISTS movie_feature_vectors AS
+        SELECT
+            m.popularity,
+            m.vote_average,
+            m.vote_count,
+            m.runtime,
+            m.roi,
+            f.*
+        FROM movies m
+        JOIN movie_features f ON f.movie_id = m.movie_id
         """)
 
         conn.commit()
         conn.close()
 
+        # Columnar copy of movies for the viewer's analytical queries
+        movies_df.to_parquet(self.parquet_path, index=False)
+
         print("Data pipeline completed successfully!")
 
 
@@ -148,14 +526,20 @@ def main():
     pipeline = MovieRecommendationPipeline(api_key)
 
     # Extract data
-    movies_df = pipeline.extract_movie_data(
-        num_pages=5)  # Adjust number of pages as needed
+    async def extract():
+        async with pipeline:
+            return await pipeline.extract_movie_data(
+                num_pages=5)  # Adjust number of pages as needed
+
+    asyncio.run(extract())
+    movies_df = pipeline.read_raw_movies()
 
     # Transform data
-    processed_df, features_df = pipeline.transform_data(movies_df)
+    processed_df, features_df, genre_rollup_df = pipeline.transform_data(
+        movies_df)
 
     # Load data
-    pipeline.load_data(processed_df, features_df)
+    pipeline.load_data(processed_df, features_df, genre_rollup_df)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,407 @@
+import asyncio
+import json
+import sqlite3
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from aiohttp import web
+
+from movie_pipeline import MovieRecommendationPipeline, RateLimiter, retry_after_seconds
+
+
+@pytest.fixture
+def pipeline():
+    return MovieRecommendationPipeline("test-key")
+
+
+def make_frames(pipeline, movie_ids, seed=0):
+    rs = np.random.default_rng(seed)
+    n = len(movie_ids)
+    movies_df = pd.DataFrame({'movie_id': movie_ids})
+    for col in pipeline.numerical_cols:
+        movies_df[col] = rs.random(n, dtype=np.float32)
+    features_df = pd.DataFrame({
+        'movie_id': movie_ids,
+        'Action': rs.integers(0, 2, n, dtype=np.uint8),
+        'Drama': rs.integers(0, 2, n, dtype=np.uint8),
+    })
+    return movies_df, features_df
+
+
+def make_raw_movies():
+    """Rows shaped like read_raw_movies output"""
+    return pd.DataFrame({
+        'movie_id': [1, 2, 3, 4, 5],
+        'title': ['A', 'B', 'C', 'D', 'E'],
+        'release_date': ['2010-05-01', '1999-12-31', '', None, '2023-01-15'],
+        'popularity': [10.0, 55.5, 3.2, 99.9, 41.0],
+        'vote_average': [7.1, 6.4, 8.8, 5.0, 7.7],
+        'vote_count': [1200, 50, None, 800, 3000],
+        'genres': [['Action', 'Drama'], [], ['Drama'],
+                   ['Comedy', 'Action', 'Drama'], ['Science Fiction']],
+        'runtime': [120, None, 95, 140, 101],
+        'budget': [3_000_000_000, 0, 1_000_000, None, 50_000_000],
+        'revenue': [6_000_000_000, 10, None, 5_000_000, 25_000_000],
+        'director': ['D'] * 5,
+        'cast': [['Smith, Jr.']] * 5,
+        'keywords': [[]] * 5,
+    })
+
+
+def as_frame(rows):
+    return pd.DataFrame(rows, columns=['movie_id', 'rank', 'neighbor_id', 'score'])
+
+
+def test_compute_recommendations_excludes_self_and_duplicates(pipeline):
+    pipeline.top_k = 5
+    movies_df, features_df = make_frames(pipeline, [1, 2, 3, 3, 4, 5, 6, 7, 7, 8])
+
+    recs = as_frame(pipeline.compute_recommendations(movies_df, features_df))
+
+    assert (recs['movie_id'] != recs['neighbor_id']).all()
+    per_movie = recs.groupby('movie_id')
+    assert set(per_movie.groups) == {1, 2, 3, 4, 5, 6, 7, 8}
+    assert (per_movie.size() == 5).all()
+    assert (per_movie['neighbor_id'].nunique() == 5).all()
+    assert (per_movie['rank'].apply(list) == [[1, 2, 3, 4, 5]] * 8).all()
+
+
+def test_compute_recommendations_orders_scores_descending(pipeline):
+    movies_df, features_df = make_frames(pipeline, list(range(50)))
+
+    recs = as_frame(pipeline.compute_recommendations(
+        movies_df, features_df, block_size=7))
+
+    for _, group in recs.sort_values(['movie_id', 'rank']).groupby('movie_id'):
+        scores = group['score'].to_numpy()
+        assert (np.diff(scores) <= 0).all()
+
+
+def test_compute_recommendations_matches_brute_force(pipeline):
+    pipeline.top_k = 3
+    movies_df, features_df = make_frames(pipeline, list(range(10, 30)))
+
+    recs = as_frame(pipeline.compute_recommendations(movies_df, features_df))
+
+    F = np.hstack([movies_df[pipeline.numerical_cols].to_numpy(np.float64),
+                   features_df[['Action', 'Drama']].to_numpy(np.float64)])
+    F /= np.linalg.norm(F, axis=1, keepdims=True) + 1e-9
+    S = F @ F.T
+    np.fill_diagonal(S, -np.inf)
+    expected = np.sort(S, axis=1)[:, ::-1][:, :3]
+    actual = recs.sort_values(['movie_id', 'rank'])['score'].to_numpy().reshape(-1, 3)
+    np.testing.assert_allclose(actual, expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize("n, expected_k", [(1, 0), (2, 1), (3, 2)])
+def test_compute_recommendations_caps_k_for_small_inputs(pipeline, n, expected_k):
+    movies_df, features_df = make_frames(pipeline, list(range(n)))
+
+    recs = as_frame(pipeline.compute_recommendations(movies_df, features_df))
+
+    assert len(recs) == n * expected_k
+
+
+def test_encode_genres_matches_get_dummies(pipeline):
+    genre_lists = pd.Series(
+        [['Action', 'Drama'], [], ['Drama'], ['Comedy', 'Action', 'Drama'],
+         ['Science Fiction']],
+        index=[3, 4, 5, 6, 7])
+
+    encoded = pipeline.encode_genres(genre_lists)
+    expected = genre_lists.str.join(',').str.get_dummies(sep=',')
+
+    assert list(encoded.columns) == list(expected.columns)
+    assert encoded.index.equals(expected.index)
+    assert encoded.dtypes.eq(np.uint8).all()
+    np.testing.assert_array_equal(encoded.to_numpy(), expected.to_numpy())
+
+
+def test_rate_limiter_stays_within_rate():
+    rate, capacity, requests = 50, 5, 30
+
+    async def run():
+        limiter = RateLimiter(rate, capacity)
+        start = time.monotonic()
+        await asyncio.gather(*[limiter.acquire() for _ in range(requests)])
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(run())
+
+    # The initial burst is free; every request after it needs a new token
+    assert elapsed >= (requests - capacity) / rate * 0.95
+
+
+def test_transform_data_keeps_large_budgets_and_missing_vote_counts(pipeline):
+    movies_df, _, _ = pipeline.transform_data(make_raw_movies())
+
+    assert movies_df['budget'].dtype == np.int64
+    assert movies_df['budget'].iloc[0] == 3_000_000_000
+    assert movies_df['revenue'].iloc[0] == 6_000_000_000
+    assert np.isnan(movies_df['vote_count'].iloc[2])
+    for col in pipeline.numerical_cols:
+        assert movies_df[col].dtype == np.float32
+
+
+def test_transform_data_computes_roi_without_warnings(pipeline):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        movies_df, _, _ = pipeline.transform_data(make_raw_movies())
+
+    # Raw ROI is [1, 0 (no budget), -1, 0 (no budget), -0.5] before scaling
+    np.testing.assert_allclose(
+        movies_df['roi'].to_numpy(), [1.0, 0.5, 0.0, 0.5, 0.25], rtol=1e-6)
+
+
+def test_transform_data_matches_minmax_scaler_and_get_dummies(pipeline):
+    preprocessing = pytest.importorskip("sklearn.preprocessing")
+    raw = make_raw_movies()
+
+    movies_df, features_df, _ = pipeline.transform_data(raw.copy())
+
+    expected = raw.copy()
+    expected['runtime'] = expected['runtime'].fillna(expected['runtime'].mean())
+    budget = expected['budget'].fillna(0).to_numpy(dtype=np.float64)
+    revenue = expected['revenue'].fillna(0).to_numpy(dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected['roi'] = np.where(budget != 0, (revenue - budget) / budget, 0)
+    scaled = preprocessing.MinMaxScaler().fit_transform(
+        expected[pipeline.numerical_cols].astype(np.float64))
+    np.testing.assert_allclose(
+        movies_df[pipeline.numerical_cols].to_numpy(dtype=np.float64), scaled,
+        atol=1e-6)
+
+    dummies = raw['genres'].str.join(',').str.get_dummies(sep=',')
+    assert list(features_df.columns) == ['movie_id'] + list(dummies.columns)
+    assert list(features_df['movie_id']) == list(raw['movie_id'])
+    np.testing.assert_array_equal(
+        features_df.drop(columns='movie_id').to_numpy(), dummies.to_numpy())
+
+
+def test_transform_data_slices_release_year(pipeline):
+    movies_df, _, _ = pipeline.transform_data(make_raw_movies())
+
+    assert movies_df['release_year'].dtype == 'Int16'
+    assert movies_df['release_year'].tolist() == [2010, 1999, pd.NA, pd.NA, 2023]
+    assert movies_df['release_date'].iloc[0] == '2010-05-01'
+
+
+def test_transform_data_rolls_up_stats_per_genre(pipeline):
+    movies_df, _, genre_rollup_df = pipeline.transform_data(make_raw_movies())
+
+    rollup = genre_rollup_df.set_index('genre')
+    assert rollup['movie_count'].to_dict() == {
+        'Action': 2, 'Comedy': 1, 'Drama': 3, 'Science Fiction': 1}
+
+    drama = movies_df[movies_df['genres'].apply(lambda genres: 'Drama' in genres)]
+    assert rollup.loc['Drama', 'avg_rating'] == pytest.approx(
+        drama['vote_average'].mean())
+    assert rollup.loc['Drama', 'avg_popularity'] == pytest.approx(
+        drama['popularity'].mean())
+
+
+def test_parquet_path_follows_db_name(pipeline, tmp_path):
+    from view_results import MovieResultsViewer
+
+    pipeline.db_name = str(tmp_path / "custom.db")
+
+    assert pipeline.parquet_path == str(tmp_path / "custom.parquet")
+    assert MovieResultsViewer(pipeline.db_name).parquet_path == pipeline.parquet_path
+
+
+@pytest.fixture
+def loaded_db(pipeline, tmp_path):
+    """Run transform_data and load_data into a temporary database"""
+    pipeline.db_name = str(tmp_path / "movies.db")
+    pipeline.load_data(*pipeline.transform_data(make_raw_movies()))
+    conn = sqlite3.connect(pipeline.db_name)
+    yield conn
+    conn.close()
+
+
+def test_load_data_creates_indexes(pipeline, loaded_db):
+    # Reloading replaces the tables, which must not lose their indexes
+    pipeline.load_data(*pipeline.transform_data(make_raw_movies()))
+
+    indexes = {name for (name,) in loaded_db.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_movies_vote_count', 'idx_movies_vote_average',
+            'idx_movies_release_year', 'idx_movies_genres'} <= indexes
+
+
+def test_load_data_stores_average_vote_count(loaded_db):
+    (stored,) = loaded_db.execute(
+        "SELECT value FROM pipeline_stats WHERE key = 'avg_vote_count'").fetchone()
+    (average,) = loaded_db.execute("SELECT AVG(vote_count) FROM movies").fetchone()
+    assert stored == pytest.approx(average)
+
+    top_rated = loaded_db.execute(
+        "SELECT movie_id FROM top_rated_movies").fetchall()
+    above_average = loaded_db.execute(
+        "SELECT movie_id FROM movies WHERE vote_count > ? "
+        "ORDER BY vote_average DESC", (average,)).fetchall()
+    assert top_rated == above_average
+
+
+def test_load_data_uses_wal_journal(loaded_db):
+    assert loaded_db.execute("PRAGMA journal_mode").fetchone() == ('wal',)
+
+
+def test_load_data_stores_genre_features_by_movie_id(loaded_db):
+    columns = [row[1] for row in loaded_db.execute(
+        "PRAGMA table_info(movie_features)")]
+    assert columns == ['movie_id', 'Action', 'Comedy', 'Drama', 'Science Fiction']
+
+    vectors = pd.read_sql_query(
+        "SELECT * FROM movie_feature_vectors ORDER BY movie_id", loaded_db)
+    assert list(vectors['movie_id']) == [1, 2, 3, 4, 5]
+    assert {'popularity', 'roi', 'Drama'} <= set(vectors.columns)
+
+
+def test_load_data_stores_list_columns_comma_joined(loaded_db):
+    movies = pd.read_sql_query(
+        "SELECT movie_id, genres, \"cast\" FROM movies ORDER BY movie_id", loaded_db)
+    assert list(movies['genres']) == [
+        'Action,Drama', '', 'Drama', 'Comedy,Action,Drama', 'Science Fiction']
+    assert movies['cast'].iloc[0] == 'Smith, Jr.'
+
+
+def test_read_raw_movies_round_trips_list_columns(pipeline, tmp_path):
+    pipeline.db_name = str(tmp_path / "movies.db")
+    raw = make_raw_movies()
+    with sqlite3.connect(pipeline.db_name) as conn:
+        raw.assign(**{col: raw[col].map(json.dumps) for col in pipeline.list_cols}
+                   ).to_sql('movies_raw', conn, index=False)
+
+    restored = pipeline.read_raw_movies(chunksize=2)
+
+    assert restored['genres'].tolist() == raw['genres'].tolist()
+    assert restored['cast'].iloc[0] == ['Smith, Jr.']
+
+    pipeline.load_data(*pipeline.transform_data(restored))
+    with sqlite3.connect(pipeline.db_name) as conn:
+        assert conn.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'movies_raw'").fetchone() is None
+
+
+def test_load_data_rebuilds_fts_index(pipeline, loaded_db):
+    from view_results import MovieResultsViewer
+
+    raw = make_raw_movies()
+    raw.loc[0, 'title'] = 'Renamed'
+    pipeline.load_data(*pipeline.transform_data(raw))
+
+    viewer = MovieResultsViewer(pipeline.db_name)
+    assert list(viewer.search_movies('renamed')['title']) == ['Renamed']
+    assert 'A' not in set(viewer.search_movies('A')['title'])
+    assert len(viewer.search_movies('drama')) == 3
+
+
+
+def test_load_data_serves_genre_stats_from_rollup(loaded_db):
+    genre_stats = pd.read_sql_query(
+        "SELECT * FROM genre_stats ORDER BY genre", loaded_db)
+    rollup = pd.read_sql_query(
+        "SELECT * FROM genre_rollup ORDER BY genre", loaded_db)
+
+    pd.testing.assert_frame_equal(genre_stats, rollup)
+    assert list(genre_stats['genre']) == [
+        'Action', 'Comedy', 'Drama', 'Science Fiction']
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("2", 2.0), ("0", 0.0), ("-5", 0.0), ("soon", None),
+    ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+])
+def test_retry_after_seconds(value, expected):
+    assert retry_after_seconds(value) == expected
+
+
+async def serve(handlers):
+    """Start a local aiohttp server with the given path -> handler routes"""
+    app = web.Application()
+    for path, handler in handlers.items():
+        app.router.add_get(path, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_get_json_honours_retry_after(pipeline):
+    calls = []
+
+    async def limited(request):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return web.json_response({}, status=429, headers={'Retry-After': '0'})
+        return web.json_response({'ok': True})
+
+    async def run():
+        runner, base_url = await serve({'/limited': limited})
+        try:
+            async with pipeline:
+                return await pipeline.get_json(f"{base_url}/limited", {})
+        finally:
+            await runner.cleanup()
+
+    # A long backoff would time the test out if Retry-After were ignored
+    pipeline.backoff_factor = 30
+
+    assert asyncio.run(run()) == {'ok': True}
+    assert len(calls) == 2
+
+
+def test_get_json_releases_slot_during_backoff(pipeline):
+    async def flaky(request):
+        return web.json_response({}, status=503)
+
+    async def ok(request):
+        return web.json_response({'ok': True})
+
+    async def run():
+        runner, base_url = await serve({'/flaky': flaky, '/ok': ok})
+        try:
+            async with pipeline:
+                flaky_task = asyncio.create_task(
+                    pipeline.get_json(f"{base_url}/flaky", {}))
+                await asyncio.sleep(0.1)
+                start = time.monotonic()
+                result = await pipeline.get_json(f"{base_url}/ok", {})
+                elapsed = time.monotonic() - start
+                flaky_task.cancel()
+                return result, elapsed
+        finally:
+            await runner.cleanup()
+
+    pipeline.backoff_factor = 5
+    pipeline.max_concurrent_requests = 1
+
+    result, elapsed = asyncio.run(run())
+    assert result == {'ok': True}
+    assert elapsed < 1
+
+
+def test_fetch_details_works_outside_extract_movie_data(pipeline):
+    async def details(request):
+        return web.json_response({'genres': [{'name': 'Drama'}], 'runtime': 90})
+
+    async def run():
+        runner, base_url = await serve({'/movie/{movie_id}': details})
+        try:
+            pipeline.base_url = base_url
+            async with pipeline:
+                return await pipeline.fetch_details({'id': 7, 'title': 'G'})
+        finally:
+            await runner.cleanup()
+
+    row = asyncio.run(run())
+
+    assert row['genres'] == ['Drama']
+    assert row['runtime'] == 90
+    assert pipeline.build_movie_row({'id': 8, 'title': 'H', 'genre_ids': [1]})['genres'] == []
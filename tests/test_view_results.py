@@ -0,0 +1,136 @@
+import os
+import sqlite3
+
+import pytest
+
+from view_results import MovieResultsViewer, fts_match_expression, mtime_lru_cache
+
+
+class CountingReader:
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+        self._mtime_cache = {}
+
+    @mtime_lru_cache('path')
+    def read(self):
+        self.calls += 1
+        with open(self.path) as f:
+            return {'content': f.read()}
+
+
+def test_mtime_lru_cache_reuses_result_until_file_changes(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("first")
+    reader = CountingReader(str(path))
+
+    assert reader.read() == {'content': 'first'}
+    assert reader.read() == {'content': 'first'}
+    assert reader.calls == 1
+
+    path.write_text("second")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert reader.read() == {'content': 'second'}
+    assert reader.calls == 2
+
+
+def test_mtime_lru_cache_returns_copies(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("first")
+    reader = CountingReader(str(path))
+
+    reader.read()['content'] = 'mutated'
+
+    assert reader.read() == {'content': 'first'}
+
+
+@pytest.mark.parametrize("keyword, expected", [
+    ("action", '"action"*'),
+    ("Science fic", '"Science"* "fic"*'),
+    ('say "hi"', '"say"* """hi"""*'),
+    ("", ""),
+    ("   ", ""),
+])
+def test_fts_match_expression_quotes_each_word(keyword, expected):
+    assert fts_match_expression(keyword) == expected
+
+
+@pytest.fixture
+def viewer(tmp_path):
+    db_path = str(tmp_path / "movies.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE movies (title TEXT, release_year INTEGER, genres TEXT,
+                         vote_average REAL, popularity REAL)
+    """)
+    conn.executemany("INSERT INTO movies VALUES (?, ?, ?, ?, ?)", [
+        ("Star Wars", 1977, "Adventure,Action", 0.9, 0.8),
+        ("Action Jackson", 1988, "Action", 0.3, 0.2),
+        ("Say \"Anything\"", 1989, "Comedy,Drama", 0.7, 0.4),
+    ])
+    conn.execute("""
+    CREATE VIRTUAL TABLE movies_fts USING fts5(
+        title, genres, content='movies', content_rowid='rowid')
+    """)
+    conn.execute("INSERT INTO movies_fts(movies_fts) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    return MovieResultsViewer(db_path)
+
+
+def test_search_movies_prefix_matches_titles_and_genres(viewer):
+    assert list(viewer.search_movies("action")['title']) == [
+        "Star Wars", "Action Jackson"]
+    assert list(viewer.search_movies("sta")['title']) == ["Star Wars"]
+
+
+@pytest.mark.parametrize("keyword", ['"', 'anything"', 'star OR', 'NEAR(', 'a AND'])
+def test_search_movies_treats_fts_syntax_as_text(viewer, keyword):
+    # Must not raise an FTS5 syntax error
+    viewer.search_movies(keyword)
+
+
+def test_search_movies_empty_keyword_returns_everything(viewer):
+    assert list(viewer.search_movies("  ")['title']) == [
+        "Star Wars", "Say \"Anything\"", "Action Jackson"]
+
+
+@pytest.fixture
+def recommendations_viewer(tmp_path):
+    db_path = str(tmp_path / "movies.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+    CREATE TABLE movies (movie_id INTEGER, title TEXT, vote_average REAL,
+                         popularity REAL, genres TEXT)
+    """)
+    conn.executemany("INSERT INTO movies VALUES (?, ?, ?, ?, ?)", [
+        (1, "The Little Mermaid", 0.7, 0.3, "Animation"),
+        (2, "The Little Mermaid", 0.6, 0.9, "Fantasy"),
+        (3, "Aladdin", 0.8, 0.5, "Animation"),
+        (4, "Cinderella", 0.5, 0.4, "Fantasy"),
+    ])
+    conn.execute("""
+    CREATE TABLE recommendations (movie_id INTEGER, rank INTEGER,
+                                  neighbor_id INTEGER, score REAL)
+    """)
+    conn.executemany("INSERT INTO recommendations VALUES (?, ?, ?, ?)", [
+        (1, 1, 3, 0.95), (1, 2, 4, 0.87),
+        (2, 1, 4, 0.79), (2, 2, 3, 0.78),
+    ])
+    conn.commit()
+    conn.close()
+    return MovieResultsViewer(db_path)
+
+
+def test_find_movie_id_picks_most_popular_title_match(recommendations_viewer):
+    assert recommendations_viewer.find_movie_id("The Little Mermaid") == 2
+    assert recommendations_viewer.find_movie_id("Missing") is None
+
+
+def test_get_similar_movies_returns_one_ranked_list(recommendations_viewer):
+    similar = recommendations_viewer.get_similar_movies(1)
+
+    assert list(similar['movie_id']) == [3, 4]
+    assert list(similar['score']) == [0.95, 0.87]
@@ -1,12 +1,53 @@
+import os
 import sqlite3
+from functools import wraps
+import duckdb
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
 
+def file_mtime(path):
+    """Modification time of a SQLite file, including its write-ahead log"""
+    mtimes = []
+    for file_path in (path, f"{path}-wal"):
+        try:
+            mtimes.append(os.stat(file_path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+
+def mtime_lru_cache(path_attr='db_path'):
+    """Cache a method's result until the file named by path_attr changes"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self):
+            mtime = file_mtime(getattr(self, path_attr))
+            cached = self._mtime_cache.get(func.__name__)
+            if cached is None or cached[0] != mtime:
+                cached = (mtime, func(self))
+                self._mtime_cache[func.__name__] = cached
+            # Hand out a copy so callers can't mutate the cached result
+            return cached[1].copy()
+        return wrapper
+    return decorator
+
+
+def fts_match_expression(keyword):
+    """Build an FTS5 MATCH expression that prefix-matches every word"""
+    # Quote each word so user input can't inject FTS5 syntax
+    return ' '.join(
+        '"{}"*'.format(word.replace('"', '""')) for word in keyword.split())
+
+
 class MovieResultsViewer:
-    def __init__(self, db_path="movie_recommendations.db"):
+    def __init__(self, db_path="movie_recommendations.db", parquet_path=None):
         self.db_path = db_path
+        self.parquet_path = parquet_path or f"{os.path.splitext(db_path)[0]}.parquet"
+        self._mtime_cache = {}
+        # In-process columnar engine for aggregations over the Parquet export
+        self.con = duckdb.connect()
 
     def connect_db(self):
         """Create database connection"""
@@ -15,30 +56,32 @@ class MovieResultsViewer:
     def get_top_movies(self, limit=10):
         """Get top-rated movies"""
         query = """
-        SELECT title, vote_average, vote_count, popularity, genres
+        SELECT movie_id, title, vote_average, vote_count, popularity, genres
         FROM movies
-        WHERE vote_count > (SELECT AVG(vote_count) FROM movies)
+        WHERE vote_count > (
+            SELECT value FROM pipeline_stats WHERE key = 'avg_vote_count')
         ORDER BY vote_average DESC
         LIMIT ?
         """
         with self.connect_db() as conn:
             return pd.read_sql_query(query, conn, params=(limit,))
 
+    @mtime_lru_cache()
     def get_genre_statistics(self):
         """Get statistics by genre"""
         query = """
         SELECT 
-            genres,
-            COUNT(*) as movie_count,
-            ROUND(AVG(vote_average), 2) as avg_rating,
-            ROUND(AVG(popularity), 2) as avg_popularity
-        FROM movies
-        GROUP BY genres
+            genre,
+            movie_count,
+            ROUND(avg_rating, 2) as avg_rating,
+            ROUND(avg_popularity, 2) as avg_popularity
+        FROM genre_rollup
         ORDER BY movie_count DESC
         """
         with self.connect_db() as conn:
             return pd.read_sql_query(query, conn)
 
+    @mtime_lru_cache('parquet_path')
     def get_yearly_trends(self):
         """Get movie trends by year"""
         query = """
@@ -47,56 +90,90 @@ class MovieResultsViewer:
             COUNT(*) as movie_count,
             ROUND(AVG(vote_average), 2) as avg_rating,
             ROUND(AVG(popularity), 2) as avg_popularity
-        FROM movies
+        FROM read_parquet(?)
         WHERE release_year IS NOT NULL
         GROUP BY release_year
         ORDER BY release_year DESC
         """
-        with self.connect_db() as conn:
-            return pd.read_sql_query(query, conn)
+        return self.con.execute(query, [self.parquet_path]).df()
 
     def search_movies(self, keyword):
         """Search movies by title or genre"""
+        search_term = fts_match_expression(keyword)
+        if not search_term:
+            # Nothing to match on, so every movie qualifies
+            query = """
+            SELECT title, release_year, genres, vote_average, popularity
+            FROM movies
+            ORDER BY vote_average DESC
+            """
+            params = ()
+        else:
+            query = """
+            SELECT m.title, m.release_year, m.genres, m.vote_average, m.popularity
+            FROM movies_fts f
+            JOIN movies m ON m.rowid = f.rowid
+            WHERE movies_fts MATCH ?
+            ORDER BY m.vote_average DESC
+            """
+            params = (search_term,)
+        with self.connect_db() as conn:
+            return pd.read_sql_query(query, conn, params=params)
+
+    def find_movie_id(self, title):
+        """Resolve a title to a single movie id, preferring the most popular match"""
         query = """
-        SELECT title, release_year, genres, vote_average, popularity
+        SELECT movie_id
         FROM movies
-        WHERE LOWER(title) LIKE LOWER(?)
-        OR LOWER(genres) LIKE LOWER(?)
-        ORDER BY vote_average DESC
+        WHERE title = ?
+        ORDER BY popularity DESC
+        LIMIT 1
+        """
+        with self.connect_db() as conn:
+            row = conn.execute(query, (title,)).fetchone()
+        return row[0] if row else None
+
+    def get_similar_movies(self, movie_id, limit=10):
+        """Get the movies most similar to the given movie"""
+        query = """
+        SELECT n.movie_id, n.title, r.score, n.vote_average, n.popularity, n.genres
+        FROM recommendations r
+        JOIN movies n ON n.movie_id = r.neighbor_id
+        WHERE r.movie_id = ?
+        ORDER BY r.rank
+        LIMIT ?
         """
-        search_term = f"%{keyword}%"
         with self.connect_db() as conn:
-            return pd.read_sql_query(query, conn, params=(search_term, search_term))
+            return pd.read_sql_query(query, conn, params=(int(movie_id), limit))
 
+    @mtime_lru_cache()
     def get_database_summary(self):
         """Get summary statistics of the database"""
+        query = """
+        SELECT
+            COUNT(*),
+            COUNT(DISTINCT genres),
+            ROUND(AVG(vote_average), 2),
+            MIN(release_year),
+            MAX(release_year)
+        FROM movies
+        """
         with self.connect_db() as conn:
-            movie_count = pd.read_sql_query(
-                "SELECT COUNT(*) as count FROM movies", conn).iloc[0]['count']
-            genre_count = pd.read_sql_query(
-                "SELECT COUNT(DISTINCT genres) as count FROM movies", conn).iloc[0]['count']
-            avg_rating = pd.read_sql_query(
-                "SELECT ROUND(AVG(vote_average), 2) as avg FROM movies", conn).iloc[0]['avg']
-            year_range = pd.read_sql_query("""
-                SELECT 
-                    MIN(release_year) as earliest,
-                    MAX(release_year) as latest
-                FROM movies
-                WHERE release_year IS NOT NULL
-            """, conn)
+            movie_count, genre_count, avg_rating, earliest, latest = conn.execute(
+                query).fetchone()
 
         return {
             "Total Movies": movie_count,
             "Unique Genre Combinations": genre_count,
             "Average Rating": avg_rating,
-            "Year Range": f"{year_range.iloc[0]['earliest']} - {year_range.iloc[0]['latest']}"
+            "Year Range": f"{earliest} - {latest}"
         }
 
     def plot_genre_distribution(self):
         """Plot genre distribution"""
         genre_stats = self.get_genre_statistics()
         plt.figure(figsize=(12, 6))
-        sns.barplot(data=genre_stats.head(10), x='movie_count', y='genres')
+        sns.barplot(data=genre_stats.head(10), x='movie_count', y='genre')
         plt.title('Top 10 Genre Distributions')
         plt.xlabel('Number of Movies')
         plt.ylabel('Genres')
@@ -147,6 +224,13 @@ def main():
     search_results = viewer.search_movies('action')
     print(search_results)
 
+    # Recommendations example
+    if not top_movies.empty:
+        top_movie = top_movies.iloc[0]
+        print(f"\n=== Movies Similar to '{top_movie['title']}' ===")
+        similar_movies = viewer.get_similar_movies(top_movie['movie_id'])
+        print(similar_movies)
+
     # Plot visualizations
     viewer.plot_genre_distribution()
     viewer.plot_yearly_trend()